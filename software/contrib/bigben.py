@@ -1,29 +1,25 @@
-from time import sleep, ticks_diff, ticks_ms, sleep_ms
-from random import random
-
-try:
-    # Local development
-    from software.firmware.europi import OLED_WIDTH, OLED_HEIGHT, CHAR_HEIGHT
-    from software.firmware.europi import din, ain, k1, k2, oled, b1, b2, cvs, turn_off_all_cvs
-    from software.firmware.europi_script import EuroPiScript
-except ImportError:
-    # Device import path
-    from europi import *
-    from europi_script import EuroPiScript
-# https://docs.micropython.org/en/latest/rp2/quickref.html#timers
-from machine import Timer, Pin
+from array import array
+from time import ticks_diff, ticks_ms
+from random import getrandbits
+
+# the device import path, in the tests too
+from europi import *
+from europi_script import EuroPiScript
 
-try:
-    from ucollections import OrderedDict
-except ImportError:
-    from collections import OrderedDict
-try:
-    import uasyncio as asyncio
-except ImportError:
-    import asyncio
+# https://docs.micropython.org/en/latest/rp2/quickref.html#timers
+from machine import Timer, Pin, idle
+import micropython
+from micropython import const
 
 
 TRIGGER_LENGTH = 20
+DISPLAY_REFRESH = 50
+# a list rather than a tuple, as Knob.choice() only accepts lists
+CLOCK_DIVISIONS = [1, 2, 3, 4, 5, 6, 7, 8, 16, 32]
+
+# Set to 1 to print debug messages. Being a const, MicroPython strips the
+# `if DEBUG:` blocks out when compiling, so they cost nothing in the callbacks.
+DEBUG = const(0)
 
 
 class InternalClocks:
@@ -35,23 +31,34 @@ class InternalClocks:
         self.timers = []
         for _ in cvs:
             self.timers.append(Timer(mode=Timer.PERIODIC))
-
-    def reset(self, new_times=[], cb=None):
-        for clock in self.timers:
-            clock.deinit()
-            if len(new_times):
-                clock.init(period=int(new_times.pop(0)), callback=cb)
+        # the timers are re-initialised rather than replaced, so this map stays valid
+        self.timer_idx = {id(t): i for i, t in enumerate(self.timers)}
+
+    def reset(self, new_times=None, cb=None):
+        if new_times is None:
+            new_times = ()
+        for idx in range(len(self.timers)):
+            if idx < len(new_times):
+                self.reset_one(idx, period=int(new_times[idx]), cb=cb)
+            else:
+                self.reset_one(idx)
 
     def reset_one(self, idx, period=None, cb=None):
-        self.timers[idx].deinit()
+        # init() replaces whatever the timer was running, so a running timer
+        # doesn't need to be stopped first
         if period and cb:
             self.timers[idx].init(period=period, callback=cb)
+        else:
+            self.timers[idx].deinit()
 
 
 class ModeHandler:
     def __init__(self) -> None:
         self.current_mode = None
-        self.modes = OrderedDict()
+        self.modes = {}
+        # modes in registration order, so next() doesn't have to rebuild it
+        self.mode_list = []
+        self.current_idx = 0
         self.mode_inits = {}
         self.mode_exits = {}
 
@@ -59,6 +66,8 @@ class ModeHandler:
         """
         register a mode, with an optional function to call
         """
+        if mode not in self.modes:
+            self.mode_list.append(mode)
         self.modes[mode] = function
         if not self.current_mode:
             self.current_mode = mode
@@ -80,7 +89,8 @@ class ModeHandler:
         self.mode_exits[mode] = function
 
     def __call__(self, idx):
-        print(f"Called for {self.current_mode} for index {idx}")
+        if DEBUG:
+            print("Called for %s for index %d" % (self.current_mode, idx))
         if self.modes[self.current_mode]:
             return self.modes[self.current_mode](idx)
 
@@ -95,26 +105,30 @@ class ModeHandler:
     def change_mode(self, mode):
         self.run_if(self.mode_exits)
         self.current_mode = mode
+        # mode changes are rare, so finding the index here keeps next() a simple step
+        self.current_idx = self.mode_list.index(mode)
         self.run_if(self.mode_inits)
-        print(self)
+        if DEBUG:
+            print(self)
 
     def next(self):
-        modes_list = list(self.modes.keys())
-        current = modes_list.index(self.current_mode)
-        if self.current_mode == modes_list[-1]:
-            next = 0
-        else:
-            next = current + 1
-        self.change_mode(modes_list[next])
+        self.current_idx = (self.current_idx + 1) % len(self.mode_list)
+        self.change_mode(self.mode_list[self.current_idx])
 
     def reinit(self):
         self.run_if(self.mode_inits)
 
 
 class ClockStateHelper:
-    def __init__(self, times=[], indexes=[], max=16, func=None) -> None:
-        self.times = times
-        self.indexes = indexes
+    """
+    Counts the ticks of a clock, times and indexes are typed arrays of the
+    tick divisions and the cvs they trigger
+    """
+
+    def __init__(self, times=None, indexes=None, max=16, func=None, triggers=None) -> None:
+        self.times = times if times is not None else array("H")
+        self.indexes = indexes if indexes is not None else array("B")
+        self.triggers = triggers
         self.count = 0
         self.max = 16
         if func:
@@ -130,45 +144,105 @@ class ClockStateHelper:
 internal_led = Pin(25, Pin.OUT)
 
 
-def flash_led(func):
-    def wrapper(*args, **kwargs):
-        internal_led.on()
-        func(*args, **kwargs)
-        internal_led.off()
+# the outputs are PWM driven, so bind their on/off methods up front rather
+# than looking them up on every trigger
+cv_on = [cv.on for cv in cvs]
+cv_off = [cv.off for cv in cvs]
+
 
-    return wrapper
+class TriggerGroup:
+    """
+    Triggers a set of cvs, given as a bit mask, and ends them all together
+    with a single one shot timer
+    """
+
+    def __init__(self) -> None:
+        self.mask = 0
+        self.length = TRIGGER_LENGTH
+        self.timer = Timer()
+        # bound once, so arming the timer doesn't allocate
+        self.end_cb = self.end
+
+    def set_tick(self, tick):
+        """
+        keeps the triggers shorter than the clock tick that starts them, so they
+        end before the next start re-arms the timer
+        """
+        self.length = max(1, min(TRIGGER_LENGTH, tick // 2))
+
+    @micropython.native
+    def start(self, mask):
+        if DEBUG:
+            print("Triggers %02x on @ %d" % (mask, ticks_ms()))
+        # end anything still on from the last start first, so every cv started
+        # here gets a fresh rising edge and none stays on past this trigger
+        old_mask = self.mask
+        for i in range(len(cv_off)):
+            if old_mask & (1 << i):
+                cv_off[i]()
+        for i in range(len(cv_on)):
+            if mask & (1 << i):
+                cv_on[i]()
+        self.mask = mask
+        self.timer.init(period=self.length, mode=Timer.ONE_SHOT, callback=self.end_cb)
+
+    @micropython.native
+    def end(self, _):
+        mask = self.mask
+        self.mask = 0
+        if DEBUG:
+            print("Triggers %02x off @ %d" % (mask, ticks_ms()))
+        for i in range(len(cv_off)):
+            if mask & (1 << i):
+                cv_off[i]()
 
 
 class BigBen(EuroPiScript):
+    @micropython.native
     def toggle_cv(self, cv_idx):
-        print(f"Toggle cv {cv_idx} on @ {ticks_ms()}")
-        cvs[cv_idx].on()
-        asyncio.sleep_ms(TRIGGER_LENGTH)
-        print(f"Toggle cv {cv_idx} off @ {ticks_ms()}")
-        cvs[cv_idx].off()
+        self.triggers[cv_idx].start(1 << cv_idx)
 
     def __init__(self):
         super().__init__()
 
         self.quarter = 0
-        self.tempo_samples = []
-        self.tasks = {}
+        self.period_cache = 0
+        # fixed size buffer for the four taps of a tempo measurement
+        self.tempo_samples = array("i", [0] * 4)
+        self.tempo_head = 0
+        # formatted once per tempo change rather than on every display refresh
+        self.bpm_str = "No BPM"
         self.internal_clocks = InternalClocks()
+        # one trigger group per clock, their timers end the triggers so the
+        # callbacks never have to sleep
+        self.triggers = [TriggerGroup() for _ in cvs]
         self.modes = ModeHandler()
+        # the knob and display are polled from a timer, leaving the main loop idle
+        self.display_timer = Timer()
+        self.old_division = 1
+        self.last_display = None
+        # bound once, rather than on every reset of the clocks
+        self.triggered_cb = self.triggered
 
         self.setup_handlers()
 
     def mode_button(self):
-        print(f"Mode button! {self.modes}")
+        if DEBUG:
+            print("Mode button! %s" % self.modes)
         self.modes.next()
 
     def get_period(self):
-        return int(self.quarter * (4 / self.clock_division()))
+        # only changes with the tempo or the clock division, which clear the cache
+        # uses the division refresh_display() last read, rather than reading the
+        # knob again and maybe landing on a different division
+        if not self.period_cache:
+            self.period_cache = self.quarter * 4 // self.old_division
+        return self.period_cache
 
-    @flash_led
     def setup_handlers(self):
-        din.handler(self.measure_tempo)
-        b1.handler(self.measure_tempo)
+        internal_led.on()
+        din.handler(self.tempo_tick)
+        b1.handler(self.tempo_tick)
         b2.handler(self.mode_button)
 
         # divmult is in how the clocks are set up, the action is just to toggle
@@ -185,128 +259,188 @@ class BigBen(EuroPiScript):
 
         self.modes.register_mode("burst", self.burst)
         self.modes.register_mode_init("burst", self.burst_init)
-        self.modes.register_mode_exit("burst", self.burst_exit)
+        internal_led.off()
 
     def burst_init(self):
-        self.internal_clocks.reset()
         if not self.quarter > 0:
             print("No tempo")
+            self.internal_clocks.reset()
             return
 
         period = self.get_period()
 
-        evens = ClockStateHelper(times=[2, 4, 8, 16], indexes=[5, 3, 1, 0], func=self.burst)
-        three = ClockStateHelper(times=[3], indexes=[2], func=self.burst)
-        five = ClockStateHelper(times=[5], indexes=[4], func=self.burst)
-
-        self.internal_clocks.reset(new_times=[int(period / 16)], cb=evens)
-        self.internal_clocks.reset_one(2, period=int(period / 3), cb=three)
-        self.internal_clocks.reset_one(4, period=int(period / 5), cb=five)
-
-    @flash_led
+        evens = ClockStateHelper(
+            times=array("H", (2, 4, 8, 16)),
+            indexes=array("B", (5, 3, 1, 0)),
+            func=self.burst,
+            triggers=self.triggers[0],
+        )
+        three = ClockStateHelper(
+            times=array("H", (3,)),
+            indexes=array("B", (2,)),
+            func=self.burst,
+            triggers=self.triggers[2],
+        )
+        five = ClockStateHelper(
+            times=array("H", (5,)),
+            indexes=array("B", (4,)),
+            func=self.burst,
+            triggers=self.triggers[4],
+        )
+
+        self.triggers[0].set_tick(period // 16)
+        self.triggers[2].set_tick(period // 3)
+        self.triggers[4].set_tick(period // 5)
+        # set each clock once, rather than stopping them all and restarting some
+        clocks = self.internal_clocks
+        clocks.reset_one(0, period=period // 16, cb=evens)
+        clocks.reset_one(1)
+        clocks.reset_one(2, period=period // 3, cb=three)
+        clocks.reset_one(3)
+        clocks.reset_one(4, period=period // 5, cb=five)
+        clocks.reset_one(5)
+
+    @micropython.native
     def burst(self, _, helper):
+        internal_led.on()
         in_threshold = k2.percent() * 100
-        for c, i in enumerate(helper.indexes):
+        mask = 0
+        for c in range(len(helper.indexes)):
+            i = helper.indexes[c]
             cv_threshold = 15 + 10 * (i + 1)
             if in_threshold > cv_threshold and not helper.count % helper.times[c]:
-                print(f"Burst toggling {i} for count {helper.count}, {c}!")
-                self.toggle_cv(i)
-        sleep_ms(TRIGGER_LENGTH)
-        for i in helper.indexes:
-            cvs[i].off()
-
-    def burst_exit(self):
-        self.internal_clocks.reset()
+                if DEBUG:
+                    print("Burst toggling %d for count %d, %d!" % (i, helper.count, c))
+                mask |= 1 << i
+        if mask:
+            helper.triggers.start(mask)
+        internal_led.off()
 
     def init_divmult(self):
         if self.quarter > 0:
-            period = int(self.get_period() / 8)
+            period = self.get_period() // 8
+            self.triggers[0].set_tick(period)
             evens = ClockStateHelper(
-                times=[32, 16, 8, 4, 2, 1], max=64, indexes=[0, 1, 2, 3, 4, 5], func=self.divmult
+                times=array("H", (32, 16, 8, 4, 2, 1)),
+                max=64,
+                indexes=array("B", (0, 1, 2, 3, 4, 5)),
+                func=self.divmult,
+                triggers=self.triggers[0],
             )
             self.internal_clocks.reset(new_times=[period], cb=evens)
         else:
             print("No tempo")
             self.internal_clocks.reset()
 
-    @flash_led
+    @micropython.native
     def divmult(self, _, helper):
-        for c, i in enumerate(helper.indexes):
+        internal_led.on()
+        mask = 0
+        for c in range(len(helper.indexes)):
             if not helper.count % helper.times[c]:
-                self.toggle_cv(i)
-        sleep_ms(TRIGGER_LENGTH)
-        for i in helper.indexes:
-            cvs[i].off()
+                mask |= 1 << helper.indexes[c]
+        if mask:
+            helper.triggers.start(mask)
+        internal_led.off()
 
     def exit_divmult(self):
+        # the next mode's init sets every clock, so they're left running here
         print("Exit divmult")
-        self.internal_clocks.reset()
 
     def init_generic(self):
-        self.internal_clocks.reset()
         if self.quarter > 0:
             # init a single clock at the tempo
             times = [self.get_period()]
-            self.internal_clocks.reset(new_times=times, cb=self.triggered)
+            for group in self.triggers:
+                group.set_tick(times[0])
+            self.internal_clocks.reset(new_times=times, cb=self.triggered_cb)
         else:
             print("No tempo")
+            self.internal_clocks.reset()
 
     def dilla(self, idx):
         print("wobble")
 
     def exit_dilla(self):
         print("Exit dilla")
-        self.internal_clocks.reset()
 
     def random(self, idx):
         """
         Random gates over all six outputs, roughly aligned to the clock
         """
-        seed = str(random()).replace("0.", "")
-        for i, cv in enumerate(cvs):
-            comp = int(seed[i]) % (i + 1)
+        # four random bits per output
+        seed = getrandbits(24)
+        mask = 0
+        for i in range(len(cvs)):
+            comp = ((seed >> (i * 4)) & 0xF) % (i + 1)
             if not comp or comp == i:
-                print(f"cv {i} on for seed {seed}:{comp}")
-                cv.on()
-        sleep_ms(TRIGGER_LENGTH)
-        turn_off_all_cvs()
+                if DEBUG:
+                    print("cv %d on for seed %06x:%d" % (i, seed, comp))
+                mask |= 1 << i
+        if mask:
+            self.triggers[idx].start(mask)
+
+    def tempo_tick(self):
+        """
+        Records the time of the tick, the tempo is measured every four ticks
+        """
+        if self.tempo_head < 4:
+            self.tempo_samples[self.tempo_head] = ticks_ms()
+            self.tempo_head += 1
+        self.measure_tempo()
 
     def measure_tempo(self):
-        self.tempo_samples.append(ticks_ms())
-        if len(self.tempo_samples) >= 4:
-            total_time = self.tempo_samples[-1] - self.tempo_samples[-4]
+        if self.tempo_head >= 4:
+            # ticks_ms() wraps around, so the samples can't just be subtracted
+            total_time = ticks_diff(self.tempo_samples[3], self.tempo_samples[0])
             self.quarter = total_time
-            print(f"tempo measured! {total_time} {self.quarter} {self.tempo_bpm():.2f}")
+            self.period_cache = 0
+            self.bpm_str = "%.2f" % (4 * self.tempo_bpm()) if self.quarter > 0 else "No BPM"
+            if DEBUG:
+                print("tempo measured! %d %d %.2f" % (total_time, self.quarter, self.tempo_bpm()))
+            # restarts the clocks even if the tempo is unchanged, so they line up
+            # with the incoming ticks again rather than drifting away from them
             self.modes.reinit()
-            self.tempo_samples = []
+            self.tempo_head = 0
 
-    @flash_led
+    @micropython.native
     def triggered(self, timer):
-        i = self.internal_clocks.timers.index(timer)
-        print(f"Timer {i} triggered")
+        internal_led.on()
+        i = self.internal_clocks.timer_idx[id(timer)]
+        if DEBUG:
+            print("Timer %d triggered" % i)
         self.modes(i)
+        internal_led.off()
 
     def clock_division(self):
-        return k1.choice([1, 2, 3, 4, 5, 6, 7, 8, 16, 32])
+        return k1.choice(CLOCK_DIVISIONS)
 
-    def display_name(self):
-        title = f"BigBen : {self.modes.current_mode}"
-        if self.quarter > 0:
-            return f"{title}\n{4 * self.tempo_bpm():.2f} - {self.clock_division()}"
-        else:
-            return f"{title}\nNo BPM - {self.clock_division()}"
+    def display_name(self, clock_division):
+        return "BigBen : %s\n%s - %d" % (self.modes.current_mode, self.bpm_str, clock_division)
 
     def tempo_bpm(self):
         return 60000 / self.quarter
 
+    def refresh_display(self, _):
+        # read the knob once per refresh, each read samples the ADC
+        division = self.clock_division()
+        if division != self.old_division:
+            self.old_division = division
+            self.period_cache = 0
+            self.modes.reinit()
+
+        # only push the display over i2c when its text has changed
+        display = self.display_name(division)
+        if display != self.last_display:
+            oled.centre_text(display)
+            self.last_display = display
+
     def main(self):
-        old = 1
+        self.display_timer.init(
+            period=DISPLAY_REFRESH, mode=Timer.PERIODIC, callback=self.refresh_display
+        )
         while True:
-            if self.clock_division() != old:
-                self.modes.reinit()
-                old = self.clock_division()
-
-            oled.centre_text(self.display_name())
+            idle()
 
 
 if __name__ == "__main__":
@@ -1,5 +1,11 @@
 from europi import *
 import machine
+import math
+import micropython
+from array import array
+import struct
+import _thread
+from time import ticks_ms, ticks_add, ticks_diff
 from rp2 import PIO, StateMachine, asm_pio
 from europi_script import EuroPiScript
 
@@ -33,36 +39,70 @@ output_5: oscillator 5
 output_6: oscillator 6
 '''
 
+# Frequency of C0, for a 0V input. Start with A0 because it's a nice, rational
+# number, and go down 3/4 of an octave from it.
+C0_HERTZ = 27.5 * 2 ** (-3/4)
+
+# Number of positions the tuning knobs are read at
+TUNING_KNOB_STEPS = 1000
+
+# V/oct offsets of the intervals used by the polyphony modes, shared between
+# the modes rather than each mode building its own copies
+ROOT = 0.0
+MAJOR_2ND = 2/12
+MINOR_3RD = 3/12
+MAJOR_3RD = 4/12
+TRITONE = 6/12
+FIFTH = 7/12
+MINOR_6TH = 8/12
+MAJOR_6TH = 9/12
+MINOR_7TH = 10/12
+MAJOR_7TH = 11/12
+OCTAVE = 1.0
+MAJOR_9TH = 14/12
+MINOR_10TH = 15/12
+MAJOR_10TH = 16/12
+
+# Layout of the tuning UI, which is the same for every draw
+TUNING_UI_PADDING = 2
+TUNING_UI_LINE_HEIGHT = 9
+TUNING_UI_TITLE = "Tuning"
+# Center the title at the top of the screen
+TUNING_UI_TITLE_X = int(
+    (OLED_WIDTH - ((len(TUNING_UI_TITLE) + 1) * 7)) / 2) - 1
+TUNING_BAR_X = 60
+TUNING_BAR_WIDTH = OLED_WIDTH - TUNING_BAR_X - TUNING_UI_PADDING
+TUNING_BAR_MIDDLE = int(TUNING_BAR_X + TUNING_BAR_WIDTH / 2)
+COARSE_BAR_Y = TUNING_UI_PADDING + TUNING_UI_LINE_HEIGHT
+FINE_BAR_Y = TUNING_UI_PADDING + TUNING_UI_LINE_HEIGHT * 2
+
+# How long to wait after a settings change before saving, so that several
+# changes in quick succession only write to flash once
+SAVE_DELAY_MS = 1000
+
+# Saved state: coarse tune, fine tune, max detune
+STATE_FORMAT = "<ffB"
+
 # Assembly code program for the PIO square oscillator
 # Thanks to Ben Everard at HackSpace for the basis of this program: 
 # https://hackspace.raspberrypi.com/articles/raspberry-pi-picos-pio-for-mere-mortals-part-3-sound
 @asm_pio(sideset_init=PIO.OUT_LOW)
 def square_prog():
-    # Initialize x & y variables - these are used to count down the 
-    # loops which set the length of the square wave's cycle
+    # Fetch the latest count into x, or keep the old one if nothing new has
+    # been sent. A count of 0 turns the oscillator off, holding the pin low
     label("restart")
     pull(noblock) .side(0)
     mov(x, osr)
-    mov(y, isr)
-    # Start loop
-    # Here, the pin is low, and it will count down y
-    # until y=x, then set the pin high and jump to the next section
-    label("up_loop")
-    jmp(x_not_y, "skip_up")
-    nop()         .side(1)
-    jmp("down")
-    label("skip_up")
-    jmp(y_dec, "up_loop")    
-    # Mirror the above loop, but with the pin high to form the second
-    # half of the square wave
-    label("down")
-    mov(y, isr)
-    label("down_loop")
-    jmp(x_not_y, "skip_down")
-    nop() .side(0)
-    jmp("restart")
-    label("skip_down")
-    jmp(y_dec, "down_loop")
+    jmp(not_x, "restart")
+    # Here, the pin is low, and it will count down y from x
+    mov(y, x)
+    label("low_loop")
+    jmp(y_dec, "low_loop")
+    # Set the pin high and count down again for the second half of the
+    # square wave. The delay pads this half to the same length as the first
+    mov(y, x)     .side(1) [3]
+    label("high_loop")
+    jmp(y_dec, "high_loop")
 
 # Class for managing the settings for a polyphony mode
 class PolyphonyMode:
@@ -72,28 +112,15 @@ class PolyphonyMode:
     
 # Class for managing a state machine running the PIO oscillator program
 class SquareOscillator:
-    def __init__(self, sm_id, pin, max_count, count_freq):
+    def __init__(self, sm_id, pin, count_freq):
         self._sm = StateMachine(
             sm_id, square_prog, freq=2 * count_freq, sideset_base=Pin(pin))
-        # Use exec() to load max count into ISR
-        self._sm.put(max_count)
-        self._sm.exec("pull()")
-        self._sm.exec("mov(isr, osr)")
         self._sm.active(1)
-        self._max_count = max_count
-        self._count_freq = count_freq
-
-    def set(self, value):
-        # Minimum value is -1 (completely turn off), 0 actually still
-        # produces a narrow pulse
-        value = clamp(value, -1, self._max_count)
-        self._sm.put(value)
-            
-    # Converts Hertz to the value the state machine running the PIO
-    # program needs
-    def get_pitch(self, hertz):
-        return int( -1 * (((self._count_freq / hertz) -
-            (self._max_count * 4))/4))
+        # The program starts with a count of 0, so the oscillator is off
+        self.count = 0
+        # Counts are worked out by PolySquare.update_pitches() and sent
+        # straight to the state machine
+        self.put = self._sm.put
 
 class KnobState:
     def __init__(self, k1, k2):
@@ -104,63 +131,92 @@ class PolySquare(EuroPiScript):
     def __init__(self):
         k1.set_samples(256)
         k2.set_samples(256)        
-        # PIO settings
-        max_count = 1_000_000
-        count_freq = 50_000_000
+        # PIO settings. The state machines run at twice the count frequency,
+        # so taking it from the CPU clock (set by the cpu_freq config point)
+        # runs them at the full clock speed with no fractional divider. This
+        # gives the finest pitch resolution whether or not the Pico is
+        # overclocked
+        count_freq = machine.freq() // 2
+        # Keep the lowest playable pitch the same at any clock speed
+        self.max_count = count_freq // 25
+        # Converting Hertz to a count only ever uses half of the count
+        # frequency
+        self.half_count_freq = count_freq / 2
         # Thanks to djmjr (github.com/djmjr) for testing & determining that
         # 6 oscillators can be run simultanously without any issues:
         # https://github.com/djmjr/EuroPi/blob/poly-squares-mods/software/contrib/poly_square_mods.py
         self.oscillators = [
-            SquareOscillator(0, 21, max_count, count_freq),
-            SquareOscillator(1, 20, max_count, count_freq),
-            SquareOscillator(2, 16, max_count, count_freq),
-            SquareOscillator(3, 17, max_count, count_freq),
-            SquareOscillator(4, 18, max_count, count_freq),
-            SquareOscillator(5, 19, max_count, count_freq)
+            SquareOscillator(0, 21, count_freq),
+            SquareOscillator(1, 20, count_freq),
+            SquareOscillator(2, 16, count_freq),
+            SquareOscillator(3, 17, count_freq),
+            SquareOscillator(4, 18, count_freq),
+            SquareOscillator(5, 19, count_freq)
         ]
-        # To add more polyphony modes, include them in this list. The offsets
-        # are V/oct offsets (ie, a 5th = 7/12, an octave = 1, etc.). If the number
+        # To add more polyphony modes, include them in this tuple. The offsets
+        # are V/oct offsets (ie, FIFTH = 7/12, OCTAVE = 1, etc.). If the number
         # of offsets in the tuple doesn't match the length of the self.oscillators
         # list above, oscillators will wrap back to the first offset (ie, if there
         # are 3 offsets, and 6 oscillators, the fourth oscillator will take the
         # first offset, the fifth will take the second, etc.).
-        self.modes = [
-            PolyphonyMode("Unison", (0,)),
-            PolyphonyMode("5th", (0, 0, 7/12)),
-            PolyphonyMode("Octave", (0, 0, 1)),
-            PolyphonyMode("Power chord", (0, 7/12, 1)),
-            PolyphonyMode("Stacked 5ths", (0, 7/12, 14/12)),
-            PolyphonyMode("Minor triad", (0, 7/12, 15/12)),
-            PolyphonyMode("Major triad", (0, 7/12, 16/12)),
-            PolyphonyMode("Diminished", (0, 6/12, 15/12)),
-            PolyphonyMode("Augmented", (0, 8/12, 16/12)),
-            PolyphonyMode("Major 6th", (0, 4/12, 9/12)),
-            PolyphonyMode("Major 7th", (0, 4/12, 11/12)),
-            PolyphonyMode("Minor 7th", (0, 3/12, 10/12)),
-            PolyphonyMode("Major penta.", (0, 2/12, 4/12, 7/12, 9/12, 1)),
-            PolyphonyMode("Minor penta.", (0, 2/12, 3/12, 7/12, 9/12, 1)),
-            PolyphonyMode("Whole tone", (0, 2/12, 4/12, 6/12, 8/12, 10/12))
-        ]
+        self.modes = (
+            PolyphonyMode("Unison", (ROOT,)),
+            PolyphonyMode("5th", (ROOT, ROOT, FIFTH)),
+            PolyphonyMode("Octave", (ROOT, ROOT, OCTAVE)),
+            PolyphonyMode("Power chord", (ROOT, FIFTH, OCTAVE)),
+            PolyphonyMode("Stacked 5ths", (ROOT, FIFTH, MAJOR_9TH)),
+            PolyphonyMode("Minor triad", (ROOT, FIFTH, MINOR_10TH)),
+            PolyphonyMode("Major triad", (ROOT, FIFTH, MAJOR_10TH)),
+            PolyphonyMode("Diminished", (ROOT, TRITONE, MINOR_10TH)),
+            PolyphonyMode("Augmented", (ROOT, MINOR_6TH, MAJOR_10TH)),
+            PolyphonyMode("Major 6th", (ROOT, MAJOR_3RD, MAJOR_6TH)),
+            PolyphonyMode("Major 7th", (ROOT, MAJOR_3RD, MAJOR_7TH)),
+            PolyphonyMode("Minor 7th", (ROOT, MINOR_3RD, MINOR_7TH)),
+            PolyphonyMode("Major penta.",
+                (ROOT, MAJOR_2ND, MAJOR_3RD, FIFTH, MAJOR_6TH, OCTAVE)),
+            PolyphonyMode("Minor penta.",
+                (ROOT, MAJOR_2ND, MINOR_3RD, FIFTH, MAJOR_6TH, OCTAVE)),
+            PolyphonyMode("Whole tone",
+                (ROOT, MAJOR_2ND, MAJOR_3RD, TRITONE, MINOR_6TH, MINOR_7TH))
+        )
         self.current_mode = None
+        self.update_count = 0
+        self.last_ui_state = None
         self.ui_update_requested = True
-        self.save_state_requested = False
+        self.save_deadline = None
         self.detune_amount = None
         self.coarse_tune = 0
         self.fine_tune = .5
+        self.coarse_position = None
+        self.fine_position = None
         self.tuning_mode = False
         self.max_detune = 1
+        self.saved_state = None
         self.tuning_mode_compare_knob_state = KnobState(
             None,
             None
         )
+        self.capture_tuning_knobs = False
+        # Through-zero detuning is based on each oscillator's position in the
+        # list of oscillators - the central oscillator(s) stay(s) in tune while
+        # the outer oscillators are progressively detuned. The positions
+        # don't change, so they are worked out once here.
+        oscillator_count = len(self.oscillators)
+        self.detune_factors = array("f", [i - (oscillator_count - 1) / 2
+            for i in range(oscillator_count)])
+        # The polyphony modes' offsets, already wrapped to the number of
+        # oscillators and laid out one mode after the other in a flat array
+        self.mode_offsets = array("f", [
+            mode.voltage_offsets[i % len(mode.voltage_offsets)]
+            for mode in self.modes for i in range(oscillator_count)])
         self.load_state()
+        self.update_detune_step()
 
         @b1.handler
         def tuning_mode_on():
-            self.tuning_mode_compare_knob_state = KnobState(
-                k1.percent(),
-                k2.percent()
-            )
+            # The ADC is shared between the cores, so leave reading where the
+            # knobs are to the pitch loop rather than reading them here
+            self.capture_tuning_knobs = True
             self.tuning_mode = True
             self.ui_update_requested = True
 
@@ -169,27 +225,19 @@ class PolySquare(EuroPiScript):
             self.tuning_mode = False
             self.ui_update_requested = True
             # Save the tuning settings after the button is released
-            self.save_state_requested = True
+            self.request_save()
 
         # self.max_detune is not a boolean value, in case the values need to be
         # updated in future or more than two values become available in the UI
         # (by, say, mapping it to a knob instead of a button toggle)
         @b2.handler
         def change_max_detune():
-            if self.max_detune == 1:
-                self.max_detune = 14
-            else:
-                self.max_detune = 1
+            # Swaps between 1 and 14
+            self.max_detune = 15 - self.max_detune
+            self.update_detune_step()
             self.ui_update_requested = True
-            self.save_state_requested = True
+            self.request_save()
         
-    # Converts V/oct signal to Hertz, with 0V = C0
-    def get_hertz(self, voltage):
-        # Start with A0 because it's a nice, rational number
-        a0 = 27.5
-        # Subtract 3/4 from the voltage value so that 0V = C0
-        return a0 * 2 ** (voltage - 3/4)
-    
     # Returns the linear step distance between elements such that all are
     # equally spaced. Ex, for 6 elements between 0 and 100 (inclusive), the
     # step would be 20 (the elements would then be 0, 20, 40, 60, 80, 100).
@@ -200,79 +248,72 @@ class PolySquare(EuroPiScript):
     def get_tuning(self):
         return self.coarse_tune * 8 + self.fine_tune - .5
     
-    # Through-zero detuning of current oscillator based on its position in
-    # the list of oscillators - the central oscillator(s) stay(s) in tune while 
-    # the outer oscillators are progressively detuned.
-    def get_detuning(self, detune_amount, oscillator_index):
-        oscillator_count = len(self.oscillators)
-        step_distance = self.get_step_distance(
-            0, self.max_detune, oscillator_count)
-        return detune_amount * step_distance * (oscillator_index - 
-             (oscillator_count - 1) / 2)
-    
-    # Returns a voltage offset for the oscillator based on the current
-    # polyphony mode. This allows for things like triads, with the offsets
-    # set accordingly.
-    def get_offset(self, oscillator_index):
-        mode = self.modes[self.current_mode]
-        return mode.voltage_offsets[oscillator_index % 
-            len(mode.voltage_offsets)]
+    # Recalculates the detune distance between neighbouring oscillators, which
+    # only changes along with the maximum detune
+    def update_detune_step(self):
+        self.detune_step = self.get_step_distance(
+            0, self.max_detune, len(self.oscillators))
     
-    # Saves oscillator tuning & detuning settings
+    # Schedules the settings to be saved, pushing back any save that's
+    # already waiting
+    def request_save(self):
+        self.save_deadline = ticks_add(ticks_ms(), SAVE_DELAY_MS)
+
+    # Saves oscillator tuning & detuning settings, if they've changed since
+    # they were last saved
     def save_state(self):
-        settings = {
-            "c": self.coarse_tune, 
-            "f": self.fine_tune, 
-            "m": self.max_detune
-        }
-        self.save_state_json(settings)
-        self.save_state_requested = False
+        self.save_deadline = None
+        state = struct.pack(
+            STATE_FORMAT, self.coarse_tune, self.fine_tune, self.max_detune)
+        if state == self.saved_state:
+            return
+        self.save_state_bytes(state)
+        self.saved_state = state
 
     # Loads oscillator tuning & detuning settings
     def load_state(self):
-        settings = self.load_state_json()
-        if "c" in settings:
-            self.coarse_tune = settings["c"]
-        if "f" in settings:
-            self.fine_tune = settings["f"]
-        if "m" in settings:
-            self.max_detune = settings["m"]
+        state = self.load_state_bytes()
+        # Ignore missing files, as well as settings saved in an older format
+        if len(state) != struct.calcsize(STATE_FORMAT):
+            return
+        self.coarse_tune, self.fine_tune, self.max_detune = struct.unpack(
+            STATE_FORMAT, state)
+        self.saved_state = state
 
-    # Draws the UI for the "tuning" mode
-    def draw_tuning_ui(self):
-        oled.fill(0)
-        padding = 2
-        line_height = 9
-        title = "Tuning"
-        # Center the title at the top of the screen
-        title_x = int((OLED_WIDTH - ((len(title) + 1) * 7)) / 2) - 1
-        oled.text(title, title_x, padding)
-        tuning_bar_x = 60
-        tuning_bar_width = OLED_WIDTH - tuning_bar_x - padding
-        # Coarse tuning bar
-        oled.text("coarse:", padding, padding + line_height)
-        oled.rect(tuning_bar_x, padding + line_height, tuning_bar_width, 8, 1)
-        oled.fill_rect(
-            tuning_bar_x,
-            padding + line_height,
-            int(self.coarse_tune * tuning_bar_width), 8, 1)           
-        # Fine tuning bar
-        oled.text("fine:", padding + 16, padding + line_height * 2)
-        oled.rect(
-            tuning_bar_x, padding + line_height * 2, tuning_bar_width, 8, 1)
-        if self.fine_tune < 0.5:
-            filled_bar_width = int((0.5 - self.fine_tune) * tuning_bar_width)
+    # Draws one of the tuning UI's bars, filled in to show the given value.
+    # Centred bars fill out from the middle to either side of 0.5, with a
+    # line for 0.5 itself
+    def draw_tuning_bar(self, y, value, centred):
+        oled.rect(TUNING_BAR_X, y, TUNING_BAR_WIDTH, 8, 1)
+        if not centred:
             oled.fill_rect(
-                int(tuning_bar_x + tuning_bar_width / 2 - filled_bar_width),
-                padding + line_height * 2, filled_bar_width, 8, 1)
-        elif self.fine_tune == 0.5:
-            line_x = int(tuning_bar_x + tuning_bar_width / 2)
-            oled.vline(line_x, padding + line_height * 2, 8, 1)
+                TUNING_BAR_X, y, int(value * TUNING_BAR_WIDTH), 8, 1)
+            return
+        offset = value - 0.5
+        if offset == 0:
+            oled.vline(TUNING_BAR_MIDDLE, y, 8, 1)
+            return
+        filled_bar_width = int(abs(offset) * TUNING_BAR_WIDTH)
+        if offset < 0:
+            filled_bar_x = TUNING_BAR_MIDDLE - filled_bar_width
         else:
-            oled.fill_rect(
-                int(tuning_bar_x + tuning_bar_width / 2 + 2),
-                padding + line_height * 2,
-                int((self.fine_tune - 0.5) * tuning_bar_width), 8, 1)
+            filled_bar_x = TUNING_BAR_MIDDLE + 2
+        oled.fill_rect(filled_bar_x, y, filled_bar_width, 8, 1)
+
+    # Draws the UI for the "tuning" mode
+    def draw_tuning_ui(self, bars_only=False):
+        if bars_only:
+            # Only clear the rows the bars are drawn in, leaving the title &
+            # the labels to the left of the bars as they are
+            oled.fill_rect(TUNING_BAR_X, COARSE_BAR_Y, OLED_WIDTH - TUNING_BAR_X,
+                FINE_BAR_Y + 8 - COARSE_BAR_Y, 0)
+        else:
+            oled.fill(0)
+            oled.text(TUNING_UI_TITLE, TUNING_UI_TITLE_X, TUNING_UI_PADDING)
+            oled.text("coarse:", TUNING_UI_PADDING, COARSE_BAR_Y)
+            oled.text("fine:", TUNING_UI_PADDING + 16, FINE_BAR_Y)
+        self.draw_tuning_bar(COARSE_BAR_Y, self.coarse_tune, centred=False)
+        self.draw_tuning_bar(FINE_BAR_Y, self.fine_tune, centred=True)
         oled.show()
     
     # Draws the default UI
@@ -286,30 +327,54 @@ class PolySquare(EuroPiScript):
         return abs(current - other) <= allowed_error
     
     def update_ui(self):
-        if self.tuning_mode:
-            self.draw_tuning_ui()
+        # Clear the request before drawing, so that one made by the pitch
+        # loop while the screen is being drawn isn't lost
+        self.ui_update_requested = False
+        # Knob movements often land on the same settings, so skip pushing an
+        # identical screen to the display
+        ui_state = (self.tuning_mode, self.coarse_tune, self.fine_tune,
+            self.current_mode, self.max_detune)
+        last_ui_state = self.last_ui_state
+        if ui_state == last_ui_state:
+            return
+        self.last_ui_state = ui_state
+        if ui_state[0]:
+            # If the tuning UI is already showing, only its bars need redrawing
+            self.draw_tuning_ui(
+                bars_only=last_ui_state is not None and last_ui_state[0])
         else:
             self.draw_main_ui()
-        self.ui_update_requested = False
     
     def update_tuning_settings(self):
-        new_coarse_tune = k1.percent()
-        new_fine_tune = k2.percent()
-        allowed_error = 0.005
+        # Compare whole knob positions, and only work out the tuning from
+        # them when they've changed
+        new_coarse_position = k1.read_position(TUNING_KNOB_STEPS)
+        new_fine_position = k2.read_position(TUNING_KNOB_STEPS)
+        # Button 1 has just been pressed, so these are the positions to
+        # compare the knobs against
+        if self.capture_tuning_knobs:
+            self.capture_tuning_knobs = False
+            self.tuning_mode_compare_knob_state = KnobState(
+                new_coarse_position,
+                new_fine_position
+            )
+        allowed_error = 5
         # Only update the coarse or fine tuning setting if the knob has
         # been moved since button 1 was depressed - thanks to djmjr 
         # (github.com/djmjr) for the idea:
         # https://github.com/djmjr/EuroPi/blob/poly-squares-mods/software/contrib/poly_square_mods.py
         if not (self.numbers_are_close(
-                new_coarse_tune, self.tuning_mode_compare_knob_state.k1, 
-                allowed_error) or new_coarse_tune == self.coarse_tune):
-            self.coarse_tune = new_coarse_tune
+                new_coarse_position, self.tuning_mode_compare_knob_state.k1, 
+                allowed_error) or new_coarse_position == self.coarse_position):
+            self.coarse_position = new_coarse_position
+            self.coarse_tune = new_coarse_position / TUNING_KNOB_STEPS
             self.tuning_mode_compare_knob_state.k1 = None
             self.ui_update_requested = True
         if not (self.numbers_are_close(
-                new_fine_tune, self.tuning_mode_compare_knob_state.k2, 
-                allowed_error) or new_fine_tune == self.fine_tune):               
-            self.fine_tune = new_fine_tune
+                new_fine_position, self.tuning_mode_compare_knob_state.k2, 
+                allowed_error) or new_fine_position == self.fine_position):
+            self.fine_position = new_fine_position
+            self.fine_tune = new_fine_position / TUNING_KNOB_STEPS
             self.tuning_mode_compare_knob_state.k2 = None
             self.ui_update_requested = True
     
@@ -317,32 +382,77 @@ class PolySquare(EuroPiScript):
     # analog input
     def update_settings(self):
         analog_input = ain.read_voltage(32)
-        if self.tuning_mode:
-            self.update_tuning_settings()
-        else:
-            self.detune_amount = k1.percent() / 12
-            new_mode = k2.read_position(len(self.modes))
-            if not new_mode == self.current_mode:
-                self.ui_update_requested = True
-                self.current_mode = new_mode
-        for oscillator in self.oscillators:
+        # The buttons change these from the other core, so read them once to
+        # keep the whole update consistent
+        tuning_mode = self.tuning_mode
+        detune_step = self.detune_step
+        # The knobs move far more slowly than the V/oct input, and averaging
+        # their samples takes much longer, so only read them every 4th update
+        if self.update_count == 0:
+            if tuning_mode:
+                self.update_tuning_settings()
+            else:
+                self.detune_amount = k1.percent() / 12
+                new_mode = k2.read_position(len(self.modes))
+                if not new_mode == self.current_mode:
+                    self.ui_update_requested = True
+                    self.current_mode = new_mode
+        self.update_count = (self.update_count + 1) & 3
+        # The polyphony mode's voltage offsets allow for things like triads,
+        # and these, the tuning, and the detune spread are the same for every
+        # oscillator, so only look them up once per update
+        self.update_pitches(
+            analog_input,
+            self.current_mode * len(self.oscillators),
+            self.get_tuning(),
+            self.detune_amount * detune_step)
+
+    # Sets every oscillator's pitch from the shared pitch terms. This is the
+    # one part of the update that does per-oscillator maths, so it's compiled
+    # to native code
+    @micropython.native
+    def update_pitches(self, analog_input, offsets_base, tuning, detune):
+        offsets = self.mode_offsets
+        detune_factors = self.detune_factors
+        max_count = self.max_count
+        half_count_freq = self.half_count_freq
+        for oscillator_index, oscillator in enumerate(self.oscillators):
             # Add up the V/oct from the analog input, the offset from the 
             # polyphony mode, the adjustment from the tuning, and the 
             # adjustment from the detune amount to get the final pitch for 
             # the oscillator
-            oscillator_index = self.oscillators.index(oscillator)
-            oscillator.set(oscillator.get_pitch(
-                self.get_hertz(
-                    analog_input + self.get_offset(oscillator_index) +
-                    self.get_tuning() +
-                    self.get_detuning(self.detune_amount, oscillator_index))))
+            voltage = (analog_input + offsets[offsets_base + oscillator_index] +
+                tuning + detune * detune_factors[oscillator_index])
+            # Convert the voltage to Hertz, with 0V = C0, and the Hertz to the
+            # count the PIO program needs - each half of the wave spends 5
+            # cycles outside of its countdown loop
+            count = int(half_count_freq / (C0_HERTZ * math.pow(2, voltage))) - 5
+            # Pitches too low to count out are turned off with 0; anything
+            # else needs a count of at least 1
+            count = 0 if count > max_count else (1 if count < 1 else count)
+            # The program keeps playing the last count it was sent, so only
+            # send counts that change the pitch
+            if count != oscillator.count:
+                oscillator.count = count
+                oscillator.put(count)
 
-    def main(self):
+    # Keeps the oscillators tracking the inputs, on the second core
+    def pitch_loop(self):
         while True:
             self.update_settings()
+
+    def main(self):
+        # Run one update before starting the pitch loop so that there is a
+        # polyphony mode to draw. From then on, the slow screen & flash writes
+        # stay on this core and can't hold up the pitch updates
+        self.update_settings()
+        _thread.start_new_thread(self.pitch_loop, ())
+        while True:
             if self.ui_update_requested:
                 self.update_ui()
-            if self.save_state_requested:
+            save_deadline = self.save_deadline
+            if (save_deadline is not None and
+                    ticks_diff(ticks_ms(), save_deadline) >= 0):
                 self.save_state()
 
 # Main script execution
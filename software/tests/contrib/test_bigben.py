@@ -0,0 +1,118 @@
+import sys
+import pytest
+import utime
+
+# ticks_ms() on MicroPython wraps around at 2**30
+TICKS_PERIOD = 1 << 30
+
+
+def ticks_diff(ticks1, ticks2):
+    """A stand in for MicroPython's ticks_diff, which accounts for ticks_ms() wrapping."""
+    return ((ticks1 - ticks2 + TICKS_PERIOD // 2) & (TICKS_PERIOD - 1)) - TICKS_PERIOD // 2
+
+
+@pytest.fixture
+def bigben(monkeypatch):
+    # the time module isn't as easily mocked as the utime module is, so swap it out before import
+    monkeypatch.setitem(sys.modules, "time", utime)
+    from contrib import bigben
+
+    monkeypatch.setattr(bigben, "ticks_diff", ticks_diff)
+    return bigben
+
+
+def tap(monkeypatch, bigben, script, times):
+    for t in times:
+        monkeypatch.setattr(bigben, "ticks_ms", lambda: t)
+        script.tempo_tick()
+
+
+@pytest.mark.parametrize(
+    "times, expected_quarter",
+    [
+        ([1000, 1100, 1200, 1300], 300),
+        ([TICKS_PERIOD - 150, TICKS_PERIOD - 50, 50, 150], 300),
+    ],
+)
+def test_measure_tempo(bigben, monkeypatch, times, expected_quarter):
+    script = bigben.BigBen()
+
+    tap(monkeypatch, bigben, script, times)
+
+    assert script.quarter == expected_quarter
+    assert script.bpm_str == "800.00"
+    assert script.tempo_head == 0
+
+
+def test_measure_tempo_needs_four_taps(bigben, monkeypatch):
+    script = bigben.BigBen()
+
+    tap(monkeypatch, bigben, script, [1000, 1100, 1200])
+
+    assert script.quarter == 0
+    assert script.bpm_str == "No BPM"
+
+
+def test_steady_tempo_realigns_clocks(bigben, monkeypatch):
+    script = bigben.BigBen()
+    script.modes.change_mode("random")
+    inits = []
+    timer = script.internal_clocks.timers[0]
+    monkeypatch.setattr(timer, "init", lambda **kwargs: inits.append(kwargs["period"]))
+
+    tap(monkeypatch, bigben, script, [1000, 1100, 1200, 1300])
+    tap(monkeypatch, bigben, script, [1400, 1500, 1600, 1700])
+
+    # the same tempo twice still restarts the clock, to line it up with the taps
+    assert len(inits) == 2
+    assert inits[0] == inits[1]
+
+
+@pytest.fixture
+def cv_calls(bigben, monkeypatch):
+    calls = []
+    monkeypatch.setattr(bigben, "cv_on", [lambda i=i: calls.append(("on", i)) for i in range(6)])
+    monkeypatch.setattr(bigben, "cv_off", [lambda i=i: calls.append(("off", i)) for i in range(6)])
+    return calls
+
+
+def test_trigger_group_retrigger_gives_fresh_edges(bigben, cv_calls):
+    group = bigben.TriggerGroup()
+
+    group.start(0b011)
+    group.start(0b110)
+
+    assert cv_calls == [("on", 0), ("on", 1), ("off", 0), ("off", 1), ("on", 1), ("on", 2)]
+
+    del cv_calls[:]
+    group.end(None)
+
+    assert cv_calls == [("off", 1), ("off", 2)]
+    assert group.mask == 0
+
+
+@pytest.mark.parametrize("tick, expected_length", [(1000, 20), (30, 15), (1, 1)])
+def test_trigger_group_length_fits_the_tick(bigben, tick, expected_length):
+    group = bigben.TriggerGroup()
+
+    group.set_tick(tick)
+
+    assert group.length == expected_length
+
+
+def test_period_uses_the_displayed_division(bigben, monkeypatch):
+    script = bigben.BigBen()
+    monkeypatch.setattr(script, "clock_division", lambda: pytest.fail("read the knob"))
+    script.quarter = 300
+    script.old_division = 4
+
+    assert script.get_period() == 300
+
+
+def test_next_mode_follows_change_mode(bigben):
+    script = bigben.BigBen()
+
+    script.modes.change_mode("random")
+    script.modes.next()
+
+    assert script.modes.current_mode == "burst"
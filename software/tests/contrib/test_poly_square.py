@@ -0,0 +1,93 @@
+import json
+import sys
+import pytest
+import utime
+
+
+@pytest.fixture
+def poly_square(monkeypatch, tmp_path):
+    # the time module isn't as easily mocked as the utime module is, so swap it out before import
+    monkeypatch.setitem(sys.modules, "time", utime)
+    # keep the saved state files out of the source tree
+    monkeypatch.chdir(tmp_path)
+    from contrib import poly_square
+
+    return poly_square
+
+
+@pytest.fixture
+def script(poly_square):
+    return poly_square.PolySquare()
+
+
+def test_save_load_state(poly_square, script):
+    script.coarse_tune = 0.25
+    script.fine_tune = 0.75
+    script.max_detune = 14
+    script.save_state()
+
+    loaded = poly_square.PolySquare()
+
+    assert loaded.coarse_tune == 0.25
+    assert loaded.fine_tune == 0.75
+    assert loaded.max_detune == 14
+
+
+def test_unchanged_state_is_not_saved_again(script, monkeypatch):
+    script.save_state()
+    saves = []
+    monkeypatch.setattr(script, "save_state_bytes", saves.append)
+
+    script.save_state()
+
+    assert saves == []
+
+
+def test_legacy_json_state_is_ignored(poly_square, script):
+    with open(script._state_filename, "w") as file:
+        file.write(json.dumps({"c": 0.5, "f": 0.1, "m": 14}))
+
+    loaded = poly_square.PolySquare()
+
+    assert loaded.coarse_tune == 0
+    assert loaded.fine_tune == 0.5
+    assert loaded.max_detune == 1
+
+
+@pytest.mark.parametrize(
+    "voltage, expected_count",
+    [
+        # A0, A4 and A8: 62.5MHz (half the count frequency at 250MHz) / Hertz, less 5 cycles
+        (0.75, 2272722),
+        (4.75, 142040),
+        (8.75, 8872),
+    ],
+)
+def test_voltage_to_count(script, voltage, expected_count):
+    script.update_pitches(voltage, 0, 0, 0)
+
+    for oscillator in script.oscillators:
+        assert oscillator._sm.puts == [expected_count]
+
+
+def test_too_low_pitch_turns_the_oscillator_off(script):
+    script.update_pitches(4.75, 0, 0, 0)
+    script.update_pitches(-10, 0, 0, 0)
+
+    for oscillator in script.oscillators:
+        assert oscillator._sm.puts == [142040, 0]
+
+
+def test_count_is_at_least_one(script):
+    script.update_pitches(30, 0, 0, 0)
+
+    for oscillator in script.oscillators:
+        assert oscillator._sm.puts == [1]
+
+
+def test_unchanged_count_is_not_sent_again(script):
+    script.update_pitches(4.75, 0, 0, 0)
+    script.update_pitches(4.75, 0, 0, 0)
+
+    for oscillator in script.oscillators:
+        assert oscillator._sm.puts == [142040]
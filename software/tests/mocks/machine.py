@@ -16,6 +16,7 @@ class I2C:
 
 class Pin:
     IN = "in"
+    OUT = "out"
 
     def __init__(self, id, *args):
         pass
@@ -26,6 +27,12 @@ class Pin:
     def value(self, *args):
         pass
 
+    def on(self):
+        pass
+
+    def off(self):
+        pass
+
 
 class PWM:
     def __init__(self, *args):
@@ -52,5 +59,9 @@ class Timer:
         pass
 
 
-def freq(_):
+def freq(_=None):
+    return 250_000_000
+
+
+def idle():
     pass
@@ -0,0 +1,6 @@
+def const(value):
+    return value
+
+
+def native(func):
+    return func
@@ -6,7 +6,20 @@ class PIO:
 
 
 class StateMachine:
-    pass
+    def __init__(self, id, program=None, *args, **kwargs):
+        self.id = id
+        self.program = program
+        self.kwargs = kwargs
+        self.puts = []
+
+    def active(self, *args):
+        pass
+
+    def exec(self, instruction):
+        pass
+
+    def put(self, value, shift=0):
+        self.puts.append(value)
 
 
 def asm_pio(**kwargs):